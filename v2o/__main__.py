@@ -72,14 +72,14 @@ def get_case(case_file):
 		else:
 			# This is an assembly, lattice, or pincell
 			# Examine the 1 assembly and see
-			assembly0 = list(case.assemblies.values())[0]
+			assembly0 = next(iter(case.assemblies.values()))
 			if len(assembly0.cellmaps) > 1:
 				# This is a 3D assembly
 				return 3, case
 			else:
 				# This is a lattice or pincell
 				# Examine the 1 cellmap and see
-				cellmap0 = list(assembly0.cellmaps.values())[0]
+				cellmap0 = next(iter(assembly0.cellmaps.values()))
 				if len(cellmap0) > 1:
 					# This is a 2D lattice
 					return 2, case
@@ -257,7 +257,7 @@ class Conversion:
 		
 		## FIXME: I think this is where the problem is ##
 		self._pwr_assembly0 = None
-		self._assembly0 = list(self._case.assemblies.values())[0]
+		self._assembly0 = next(iter(self._case.assemblies.values()))
 		self._pwr_assembly0 = self._case.get_openmc_assembly(self._assembly0)
 		self._pitch = self._get_pitch()
 		
@@ -327,7 +327,7 @@ class Conversion:
 		max_y = openmc.YPlane(y0=+ny*p/2.0, boundary_type=bounds[3], name="Bound - max y")
 		min_z = openmc.ZPlane(z0=zrange[0], boundary_type=bounds[4], name="Bound - min z")
 		max_z = openmc.ZPlane(z0=zrange[1], boundary_type=bounds[5], name="Bound - max z")
-		region = +min_x & -max_x & +min_y & -max_y & +min_z & -max_z
+		region = openmc.Intersection((+min_x, -max_x, +min_y, -max_y, +min_z, -max_z))
 		return region
 	
 	def export_to_xml(self):
@@ -386,7 +386,7 @@ class PincellConversion(Conversion):
 	def _get_root_universe(self):
 		"""Fill the root universe with the pincell universe"""
 		root_universe = openmc.Universe(universe_id=0, name="root universe")
-		pincell = list(self._assembly0.cells.values())[0]
+		pincell = next(iter(self._assembly0.cells.values()))
 		root_cell = openmc.Cell(cell_id=0, name="root cell")
 		root_cell.fill = self._case.get_openmc_pincell(pincell)
 		root_cell.region = self.get_cubic_boundaries(zrange=(0.0, 1.0))
@@ -420,7 +420,7 @@ class LatticeConversion(LatticeBaseConversion):
 		return self._case.core.pitch
 	
 	def _add_spacergrids(self, lattice):
-		sg = list(self._assembly0.spacergrids.values())[0]
+		sg = next(iter(self._assembly0.spacergrids.values()))
 		mat = self._case.get_openmc_material(sg.material, asname=self._assembly0.name)
 		grid = pwr.SpacerGrid(sg.name, sg.height, sg.mass, mat,
 		                      self._assembly0.pitch, self._assembly0.npins)
@@ -470,7 +470,7 @@ class AssemblyConversion(LatticeBaseConversion):
 		asmbly_universe = self._pwr_assembly0.universe
 		# The last cell of the universe should contain the moderator.
 		# We need to get the key to this before adding any more cells.
-		mod_key = list(asmbly_universe.cells.keys())[-1]
+		mod_key = next(reversed(asmbly_universe.cells.keys()))
 		
 		lplate = self._case.core.bot_refl
 		uplate = self._case.core.top_refl
@@ -60,10 +60,15 @@ def fill_lattice(keys, lam, n=0, dtype=object):
 		n = len(keys)
 	
 	lattice = numpy.empty((n, n), dtype)
+	# Each distinct key is only passed to lam() once
+	found = {}
 	for j in range(n):
+		row = keys[j]
 		for i in range(n):
-			c = keys[j][i]
-			lattice[j, i] = lam(c)
+			c = row[i]
+			if c not in found:
+				found[c] = lam(c)
+			lattice[j, i] = found[c]
 	
 	return lattice
 
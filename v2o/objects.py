@@ -216,6 +216,19 @@ class Assembly:
 	def __str__(self):
 		return self.name
 	
+	def fast_clone(self):
+		"""Return a shallow copy of this Assembly, ready for add_insert().
+		
+		Only the dictionaries that add_insert() modifies in place (cells and key_maps)
+		are copied, so that inserting into the clone leaves the original untouched.
+		The pwr spacer grids and nozzles are still shared with the original.
+		"""
+		clone = self.__class__.__new__(self.__class__)
+		clone.__dict__ = self.__dict__.copy()
+		clone.cells = dict(self.cells)
+		clone.key_maps = dict(self.key_maps)
+		return clone
+	
 	def lookup(self, c, blank = "-"):
 		if c != blank:
 			"""
@@ -520,12 +533,11 @@ class CoreMap:
 		"""Return the cell map as a square array"""
 		nx = self.nx
 		ny = self.ny
-		smap = numpy.empty((ny, nx), dtype = object)
-		for j in range(ny):
-			for i in range(nx):
-				k = ny*j + i
-				smap[j, i] = self.cell_map[k]
-		return smap
+		flat = numpy.empty(len(self.cell_map), dtype = object)
+		flat[:] = self.cell_map
+		# Position (j, i) is taken from index ny*j + i of the flat map
+		k = ny*numpy.arange(ny)[:, None] + numpy.arange(nx)
+		return flat[k]
 	
 	def __get_str_map(self):
 		"""Return a string of the square map nicely."""
@@ -678,7 +690,7 @@ class Core:
 		smap = self.shape.square_map
 		# Create a new blank map for the assembly layout
 		n = self.size
-		amap = numpy.empty((n, n), dtype = str)
+		amap = numpy.empty((n, n), dtype = object)
 		j = 0
 		for row in range(n):
 			for col in range(n):
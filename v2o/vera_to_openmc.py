@@ -7,11 +7,14 @@ import numpy
 import math
 import openmc
 import pwr
-from copy import copy
+from itertools import chain
 from v2o.objects import Nozzle
 from v2o.read_xml import Case
 from v2o.functions import fill_lattice, clean
 
+# openmc.Element instances shared by every MC_Case: {"Symbol":openmc.Element}
+_ELEMENTS = {}
+
 
 class MC_Case(Case):
 	"""An extension of the Case class from read_xml,
@@ -21,7 +24,6 @@ class MC_Case(Case):
 	def __init__(self, source_file):
 		super(MC_Case, self).__init__(source_file)
 		
-		self.openmc_surfaces = []
 		# The following dictionaries use key-value pairs of 'coefficient':openmc.Surface
 		self.openmc_xplanes = {}  # {str(x0):openmc.XPlane)
 		self.openmc_yplanes = {}  # {str(y0):openmc.YPlane)
@@ -29,7 +31,15 @@ class MC_Case(Case):
 		self.openmc_cylinders = {}  # {str(R):openmc.Cylinder)
 		
 		self.openmc_materials = {}
+		# Resolved material keys: {(material, asname, inname): key in self.materials}
+		self.material_keys = {}
 		self.openmc_pincells = {}
+		# Pin cells with identical rings share a universe:
+		# {(tuple(radii), tuple(mats), asname, inname):openmc.Universe}
+		self.openmc_pin_signatures = {}
+		# Lattices are shared by every level with the same pin layout:
+		# {(tuple(pin keys), pitch, npins):openmc.RectLattice}
+		self.openmc_lattices = {}
 		self.openmc_assemblies = {}
 		
 		# ID Counter
@@ -51,6 +61,12 @@ class MC_Case(Case):
 		self.mod_verse = openmc.Universe(self.counter.add_universe(),
 		                                 name = "Infinite Mod Universe", cells = (self.mod_cell,))
 	
+	@property
+	def openmc_surfaces(self):
+		"""List of all the openmc.Surface instances in the surface dictionaries"""
+		return list(chain(self.openmc_xplanes.values(), self.openmc_yplanes.values(),
+		                  self.openmc_zplanes.values(), self.openmc_cylinders.values()))
+	
 	def __get_surface(self, dim, coeff, name = "", rd = 5):
 		"""Wrapper for pwr.get_surface()
 
@@ -79,6 +95,32 @@ class MC_Case(Case):
 		openmc_surf = pwr.get_surface(self.counter, surfdict, dim, coeff, name, rd)
 		return openmc_surf
 	
+	def __make_ring(self, r, name, fill, last_s = None):
+		"""Create one ring of a pin cell: the cell inside the Z cylinder of
+		radius 'r' and outside 'last_s', filled with 'fill'.
+		
+		Inputs:
+			r:          float; outer radius of the ring (cm)
+			name:       string; name of the new cell and (if new) of its surface
+			fill:       instance of openmc.Material to fill the ring with
+			last_s:     instance of openmc.ZCylinder bounding the ring on the inside,
+						or None for the innermost ring
+		
+		Outputs:
+			new_cell:   instance of openmc.Cell
+			s:          instance of openmc.ZCylinder bounding the ring on the outside
+		"""
+		s = self.__get_surface("cylinder", r, name = name)
+		new_cell = openmc.Cell(self.counter.add_cell(), name)
+		if last_s is None:
+			# Inner ring
+			new_cell.region = -s
+		else:
+			# Then this OpenMC cell is outside the previous (last_s), inside the current
+			new_cell.region = -s & +last_s
+		new_cell.fill = fill
+		return new_cell, s
+	
 	def get_axial_zones(self, d = 4):
 		"""Return lists used for the axial power distribution tally.
 		
@@ -162,16 +204,22 @@ class MC_Case(Case):
 		
 		# Handle the permutations/combinations of suffixes.
 		# This order should be preserved.
-		all_suffixes = [asname + inname, asname, inname]
-		for suffix in all_suffixes:
-			if material + suffix in self.materials:
-				material += suffix
-				break
-		
-		if material in self.openmc_materials:
-			# Look it up as normal
-			openmc_material = self.openmc_materials[material]
+		# Each combination only needs to be resolved once.
+		key = (material, asname, inname)
+		resolved = self.material_keys.get(key)
+		if resolved is not None:
+			material = resolved
 		else:
+			all_suffixes = [asname + inname, asname, inname]
+			for suffix in all_suffixes:
+				if material + suffix in self.materials:
+					material += suffix
+					break
+			self.material_keys[key] = material
+		
+		# Look it up as normal
+		openmc_material = self.openmc_materials.get(material)
+		if openmc_material is None:
 			# Then the material doesn't exist yet in OpenMC form
 			# Generate it and add it to the index
 			vera_mat = self.materials[material]
@@ -179,13 +227,14 @@ class MC_Case(Case):
 			openmc_material = openmc.Material(m_id, material)
 			openmc_material.set_density("g/cc", vera_mat.density)
 			openmc_material.temperature = vera_mat.temperature
-			for nuclide in sorted(vera_mat.isotopes):
-				frac = vera_mat.isotopes[nuclide]
+			for nuclide, frac in sorted(vera_mat.isotopes.items()):
 				if nuclide[-2:] == "00":
 					# Natural abundance-expand except for Carbon
 					ename = nuclide[:-2]
+					if ename not in _ELEMENTS:
+						_ELEMENTS[ename] = openmc.Element(ename)
 					# Element.expand() breaks an element into its constituent nuclides
-					openmc_material.add_element(openmc.Element(ename), frac, 'wo')
+					openmc_material.add_element(_ELEMENTS[ename], frac, 'wo')
 				else:
 					openmc_material.add_nuclide(nuclide, frac, 'wo')
 			if material in self.colors:
@@ -213,44 +262,39 @@ class MC_Case(Case):
 		# First, check if this cell has already been created
 		if vera_cell.key in self.openmc_pincells:
 			return self.openmc_pincells[vera_cell.key]
+		# Then, check if an identical cell has been created under another key
+		n = vera_cell.num_rings
+		radii = tuple(vera_cell.radii[:n])
+		mats = tuple(vera_cell.mats[:n])
+		asname = vera_cell.asname
+		inname = vera_cell.inname
+		cell_name = vera_cell.name
+		signature = (radii, mats, asname, inname)
+		if signature in self.openmc_pin_signatures:
+			pincell_universe = self.openmc_pin_signatures[signature]
+			self.openmc_pincells[vera_cell.key] = pincell_universe
+			return pincell_universe
 		else:
 			openmc_cells = []
-			# Before proceeding, define the OpenMC surfaces (Z cylinders)
-			for ring in range(vera_cell.num_rings):
-				r = vera_cell.radii[ring]
-				name = vera_cell.name + "-ring" + str(ring)
-				s = self.__get_surface("cylinder", r, name = name)
-				# Otherwise, the surface s already exists
-				# Proceed to define the cell inside that surface:
-				new_cell = openmc.Cell(self.counter.add_cell(), name)
-				
-				if ring == 0:
-					# Inner ring
-					new_cell.region = -s
-					last_s = s
-				else:
-					# Then this OpenMC cell is outside the previous (last_s), inside the current
-					new_cell.region = -s & +last_s
-					last_s = s
-				
-				# Fill the cell in with a material
-				m = vera_cell.mats[ring]
-				fill = self.get_openmc_material(m, vera_cell.asname, vera_cell.inname)
-				
-				# What I want to do instead is, somewhere else in the code, generate the corresponding
-				# openmc material for each objects.Material instance. Then, just look it up in that dictionary.
-				new_cell.fill = fill
+			# Resolve the material of every ring before building any cells
+			get_material = self.get_openmc_material
+			fills = [get_material(m, asname, inname) for m in mats]
+			make_ring = self.__make_ring
+			last_s = None
+			for ring, (r, fill) in enumerate(zip(radii, fills)):
+				name = cell_name + "-ring" + str(ring)
+				new_cell, last_s = make_ring(r, name, fill, last_s)
 				openmc_cells.append(new_cell)
 			# end of "for ring" loop
 			
 			# Then add the moderator outside the pincell
-			mod_cell = openmc.Cell(self.counter.add_cell(), vera_cell.name + "-Mod")
+			mod_cell = openmc.Cell(self.counter.add_cell(), cell_name + "-Mod")
 			mod_cell.fill = self.mod
 			mod_cell.region = +last_s
 			openmc_cells.append(mod_cell)
 			
 			# Create a new universe in which the pin cell exists
-			pincell_universe = openmc.Universe(self.counter.add_universe(), vera_cell.name + "-verse")
+			pincell_universe = openmc.Universe(self.counter.add_universe(), cell_name + "-verse")
 			pincell_universe.add_cells(openmc_cells)
 			
 			# Initialize a useful dictionary to keep track of versions of
@@ -258,6 +302,7 @@ class MC_Case(Case):
 			pincell_universe.griddict = {}
 			
 			self.openmc_pincells[vera_cell.key] = pincell_universe
+			self.openmc_pin_signatures[signature] = pincell_universe
 			
 			return pincell_universe
 	
@@ -279,23 +324,28 @@ class MC_Case(Case):
 		# ppitch, title, num_pins, label
 		openmc_lattices = []
 		
-		# Instantiate all the pin cells (openmc.Universes) that appear in the Assembly
-		cell_verses = {}
-		for vera_cell in vera_asmbly.cells.values():
-			c = self.get_openmc_pincell(vera_cell)
-			cell_verses[vera_cell.key] = c
+		# Pin cells (openmc.Universes) are only instantiated when a lattice uses them.
+		# They are stored in self.openmc_pincells under the same keys as the key maps.
+		cells = vera_asmbly.cells
+		get_pincell = lambda key: self.get_openmc_pincell(cells[key])
 		
 		for latname in vera_asmbly.axial_labels:
+			asmap = vera_asmbly.key_maps[latname]
+			key = (tuple(asmap.cell_map), pitch, npins)
+			if key in self.openmc_lattices:
+				# Identical pin layout: reuse the existing lattice
+				openmc_lattices.append(self.openmc_lattices[key])
+				continue
+			
 			lattice = openmc.RectLattice(self.counter.add_universe(), latname)
 			lattice.pitch = (pitch, pitch)
 			lattice.lower_left = [-pitch * float(npins) / 2.0] * 2
-			# And populate with universes from cell_verses
-			asmap = vera_asmbly.key_maps[latname]
-			
-			lattice.universes = fill_lattice(asmap, lambda c:cell_verses[c], npins)
+			# And populate with the pin cell universes
+			lattice.universes = fill_lattice(asmap, get_pincell, npins)
 			lattice.outer = self.mod_verse  # To account for the assembly gap
 			# Initialize a dictionary of versions of this lattice which have spacer grids added
 			lattice.griddict = {}
+			self.openmc_lattices[key] = lattice
 			openmc_lattices.append(lattice)
 		
 		return openmc_lattices
@@ -430,66 +480,69 @@ class MC_Case(Case):
 		core_cells = []
 		
 		# Create the top and bottom planes of the core and core plate
-		# Intentionally does not use self.__get_surface() due to specific boundary conditions.
+		# The core plates intentionally do not use self.__get_surface() due to specific boundary conditions.
 		plate_bot = openmc.ZPlane(surface_id=self.counter.add_surface(),
 		                          z0=-self.core.bot_refl.thick, boundary_type=self.core.bc["bot"])
-		core_bot = openmc.ZPlane(surface_id=self.counter.add_surface(), z0 = 0.0)
-		core_top = openmc.ZPlane(surface_id=self.counter.add_surface(), z0 = self.core.height)
+		core_bot = self.__get_surface("z", 0.0, name = "Core bottom")
+		core_top = self.__get_surface("z", self.core.height, name = "Core top")
 		plate_top = openmc.ZPlane(surface_id=self.counter.add_surface(),
 		                          z0=self.core.height + self.core.top_refl.thick, boundary_type=self.core.bc["top"])
 		zregion = +core_bot & -core_top
+		# Axial extent shared by every vessel ring outside the core
+		axial_slab = +plate_bot & -plate_top
 		
 		# Create the concentric cylinders of the vessel
-		for ring in range(len(self.core.vessel_radii) - 1):
-			r = self.core.vessel_radii[ring]
-			m = self.core.vessel_mats[ring]
-			s = openmc.ZCylinder(surface_id=self.counter.add_surface(), r=r)
+		radii = self.core.vessel_radii
+		mats = self.core.vessel_mats
+		rmax = max(radii)
+		for ring, (r, m) in enumerate(zip(radii[:-1], mats[:-1])):
 			cell_name = "Vessel_" + str(ring)
+			s = self.__get_surface("cylinder", r, name = cell_name)
 			new_cell = openmc.Cell(self.counter.add_cell(), cell_name)
 			
 			if ring == 0:
 				# For the center ring,
-				new_cell.region = -s & +core_bot & -core_top
+				new_cell.region = -s & zregion
 				inside_cell = new_cell
 				inside_fill = m
 				vessel_surf = s
-				last_s = s
+				outside_last = +s
 			elif ring == 3:
 				# Neutron pad
 				pad_fill = self.get_openmc_material(m)
-				region = -s & +last_s & +plate_bot & -plate_top
+				region = openmc.Intersection((-s, outside_last, axial_slab))
 				pads = pwr.Neutron_Pads(region, pad_fill, self.mod, counter = self.counter)
 				new_cells = pads.get_cells()
 				core_cells += new_cells
-				last_s = s
+				outside_last = +s
 			else:
-				new_cell.region = -s & +last_s & +plate_bot & -plate_top
+				new_cell.region = openmc.Intersection((-s, outside_last, axial_slab))
 				new_cell.fill = self.get_openmc_material(m)
-				last_s = s
+				outside_last = +s
 				core_cells.append(new_cell)
 		
 		# And finally, the outermost ring
+		# Like the core plates, this has its own boundary condition.
 		vessel_outer = openmc.ZCylinder(surface_id=self.counter.add_surface(),
-		                                r=max(self.core.vessel_radii),
-		                                boundary_type=self.core.bc["rad"])
+		                                r=rmax, boundary_type=self.core.bc["rad"])
 		new_cell = openmc.Cell(self.counter.add_cell(), "Vessel-Outer")
-		new_cell.region = -vessel_outer & +last_s & +plate_bot & -plate_top
-		m = self.core.vessel_mats[-1]
+		new_cell.region = openmc.Intersection((-vessel_outer, outside_last, axial_slab))
+		m = mats[-1]
 		new_cell.fill = self.get_openmc_material(m)
 		core_cells.append(new_cell)
 		
 		# Add the core plates
-		top_plate_mat = self.get_openmc_material(self.core.bot_refl.material)
-		self.openmc_materials[top_plate_mat.name] = top_plate_mat
+		# get_openmc_material() already registers the material in self.openmc_materials
+		top_plate_mat = self.get_openmc_material(self.core.top_refl.material)
+		bot_plate_mat = self.get_openmc_material(self.core.bot_refl.material)
 		top_plate_cell = openmc.Cell(self.counter.add_cell(), "Top core plate")
-		top_plate_cell.region = -vessel_surf & +core_top & -plate_top
+		inside_vessel = -vessel_surf
+		top_plate_cell.region = openmc.Intersection((inside_vessel, +core_top, -plate_top))
 		top_plate_cell.fill = top_plate_mat
 		core_cells.append(top_plate_cell)
 		
-		bot_plate_mat = self.get_openmc_material(self.core.bot_refl.material)
-		self.openmc_materials[bot_plate_mat.name] = bot_plate_mat
 		bot_plate_cell = openmc.Cell(self.counter.add_cell(), "Bot core plate")
-		bot_plate_cell.region = -vessel_surf & +plate_bot & -core_bot
+		bot_plate_cell.region = openmc.Intersection((inside_vessel, +plate_bot, -core_bot))
 		bot_plate_cell.fill = bot_plate_mat
 		core_cells.append(bot_plate_cell)
 		
@@ -540,48 +593,57 @@ class MC_Case(Case):
 		det_map = self.core.detector_map.square_map
 		crd_map = self.core.control_map.square_map
 		crd_bank_map = self.core.control_bank.square_map
-		
+		# Invariant lookups used at every position
+		assemblies = self.assemblies
+		inserts = self.inserts
+		controls = self.controls
+		detectors = self.detectors
+		rodbank = self.state.rodbank
+		
+		# Positions without a fuel assembly are filled with moderator
 		lattice = numpy.empty((ny, nx), dtype=openmc.Universe)
+		lattice.fill(self.mod_verse)
+		# Assembly universes, which typically repeat by symmetry:
+		# {(askey, ins_key, crd_key, crd_bank_key, det_key):openmc.Universe}
+		universes = {}
 		
 		print("Generating core (this may take a while)...")
-		for j in range(ny):
-			for i in range(nx):
-				print("\rConfiguring position: " + str(j) + "x" + str(i) + "...", end = "")  # debug
-				# Check if there is supposed to be an assembly in this position
-				if shape[j, i]:
-					askey = asmap[j, i].lower()
-					vera_asmbly = self.assemblies[askey]
-					
-					ins_key = ins_map[j, i]
-					det_key = det_map[j, i]
-					crd_key = crd_map[j, i]
-					crd_bank_key = crd_bank_map[j, i]
-					
-					if not ((ins_key == blank) and (crd_key == blank) and (det_key == blank)):
-						vera_asmbly = copy(vera_asmbly)
-						# Handle each type of insertion differently.
-						if ins_key != blank:
-							vera_ins = self.inserts[ins_key]
-							vera_asmbly.add_insert(vera_ins)
-							vera_asmbly.name += "+" + vera_ins.name
-						if crd_key != blank:
-							vera_crd = self.controls[crd_key]
-							steps = self.state.rodbank[crd_bank_key]
-							depth = steps * vera_crd.step_size
-							vera_asmbly.add_insert(vera_crd, depth)
-							vera_asmbly.name += "+" + vera_crd.name
-						if det_key != blank:
-							# Is it any different than a regular insert?
-							vera_det = self.detectors[det_key]
-							vera_asmbly.add_insert(vera_det)
-							vera_asmbly.name += "+" + vera_det.name
-					
-					openmc_assembly = self.get_openmc_assembly(vera_asmbly)
-					
-					lattice[j, i] = openmc_assembly.universe
-				else:
-					# No fuel assembly here: fill it with moderator
-					lattice[j, i] = self.mod_verse
+		# Only visit the positions where there is supposed to be an assembly
+		for j, i in numpy.argwhere(shape):
+			askey = asmap[j, i].lower()
+			ins_key = ins_map[j, i]
+			det_key = det_map[j, i]
+			crd_key = crd_map[j, i]
+			crd_bank_key = crd_bank_map[j, i]
+			
+			composite_key = (askey, ins_key, crd_key, crd_bank_key, det_key)
+			if composite_key in universes:
+				lattice[j, i] = universes[composite_key]
+				continue
+			
+			vera_asmbly = assemblies[askey]
+			if not ((ins_key == blank) and (crd_key == blank) and (det_key == blank)):
+				vera_asmbly = vera_asmbly.fast_clone()
+				# Handle each type of insertion differently.
+				if ins_key != blank:
+					vera_ins = inserts[ins_key]
+					vera_asmbly.add_insert(vera_ins)
+					vera_asmbly.name += "+" + vera_ins.name
+				if crd_key != blank:
+					vera_crd = controls[crd_key]
+					steps = rodbank[crd_bank_key]
+					depth = steps * vera_crd.step_size
+					vera_asmbly.add_insert(vera_crd, depth)
+					vera_asmbly.name += "+" + vera_crd.name
+				if det_key != blank:
+					# Is it any different than a regular insert?
+					vera_det = detectors[det_key]
+					vera_asmbly.add_insert(vera_det)
+					vera_asmbly.name += "+" + vera_det.name
+			
+			openmc_assembly = self.get_openmc_assembly(vera_asmbly)
+			universes[composite_key] = openmc_assembly.universe
+			lattice[j, i] = openmc_assembly.universe
 		
 		openmc_core.universes = lattice
 		print("\tDone.")
@@ -613,24 +675,23 @@ class MC_Case(Case):
 
 
 if __name__ == "__main__":
+	import sys
+	# Map and object dumps are slow to format; only print them with --verbose
+	verbose = "--verbose" in sys.argv
+	
 	# Instantiate a test case with a representative VERA XML.gold
 	filename = "gold/p7.xml.gold"
 	test_case = MC_Case(filename)
 	print("Testing:", test_case)
 	
-	a = list(test_case.assemblies.values())[0]
-	test_asmblys = test_case.get_openmc_lattices(a)[0]
-	# print(test_asmbly)
+	a = next(iter(test_case.assemblies.values()))
+	test_asmbly = test_case.get_openmc_lattices(a)[0]
+	if verbose:
+		print(test_asmbly)
+		print(test_case.core.str_maps("shape"))
 	
 	# core, icell, ifill, cyl = test_case.get_openmc_reactor_vessel()
-	# print(test_case.core.square_maps("a", ''))
-	# print(test_case.core.str_maps("shape"))
 	# b = test_case.get_openmc_baffle()
-	# print(str(b))
 	
 	# core_lattice = test_case.get_openmc_core_lattice()
-	# print(core_lattice)
 	test_case.build_reactor()
-
-
-